@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import logging
 
 # Import all your components
@@ -36,17 +36,25 @@ class NativeDB:
         
         logger.info("NativeDB Ready.")
 
-    def ingest(self, raw_text: str, source_metadata: Dict[str, Any] = None):
+    def ingest(self, raw_text: Union[str, List[str]], source_metadata: Dict[str, Any] = None):
         """
         Takes raw text, parses it ONCE, and stores it everywhere.
+        Accepts a list of documents too; those are parsed as one spaCy batch.
         """
-        if not raw_text.strip():
+        if isinstance(raw_text, list):
+            texts = [t for t in raw_text if t.strip()]
+            if not texts:
+                return {"status": "ignored", "reason": "empty_text"}
+        elif not raw_text.strip():
             return {"status": "ignored", "reason": "empty_text"}
 
         logger.info("--- Starting Ingestion ---")
         
         # Step 1: Extract Structure (The heavy lifting)
-        nodes, edges = self.ingestion.extract_structured_data(raw_text)
+        if isinstance(raw_text, list):
+            nodes, edges = self._extract_many(texts)
+        else:
+            nodes, edges = self.ingestion.extract_structured_data(raw_text)
         
         # Optional: Enrich nodes with source metadata (e.g., filename, upload date)
         if source_metadata:
@@ -68,13 +76,25 @@ class NativeDB:
             "edges_count": len(edges)
         }
 
+    def _extract_many(self, texts: List[str]):
+        """
+        Parses several documents in one batch and merges their nodes/edges.
+        """
+        nodes_by_id = {}
+        edges = []
+        for doc_nodes, doc_edges in self.ingestion.extract_structured_data_many(texts):
+            for node in doc_nodes:
+                nodes_by_id.setdefault(node.id, node)
+            edges.extend(doc_edges)
+        return list(nodes_by_id.values()), edges
+
     def search(self, query: str, mode: str = "hybrid", top_k: int = 5) -> List[Dict]:
         """
         Unified Search Interface.
         Modes: 'vector', 'graph', 'hybrid'
         """
         if mode == "vector":
-            return self.vector_db.search(query, limit=top_k)
+            return self.vector_db.search(query, limit=top_k, include_metadata=True)
         
         elif mode == "graph":
             # Graph-only search usually requires a starting node ID, 
@@ -85,12 +105,28 @@ class NativeDB:
         else: # Default to Hybrid
             return self.hybrid_engine.hybrid_search(query, top_k=top_k)
 
-    def get_graph_viz(self):
+    def get_graph_viz(self, collapse: int = 0):
         """
         Helper for the Frontend to visualize the whole graph.
+        collapse > 0 folds dense communities of at least that many nodes (large graphs only).
         """
+        if collapse > 0:
+            return self.graph_db.get_collapsed_json(min_size=collapse)
         return self.graph_db.get_subgraph_json()
 
+    def get_graph_layout(self, collapse: int = 0) -> Dict[str, List[float]]:
+        """
+        Precomputed {id: [x, y]} positions so the frontend can skip client-side physics.
+        Pass the same collapse as get_graph_viz so cluster nodes are covered.
+        """
+        return self.graph_db.get_layout(min_size=max(collapse, 0))
+
+    def get_graph_version(self) -> int:
+        """
+        Changes whenever the graph is written; lets clients skip refetching /graph.
+        """
+        return self.graph_db.get_version()
+
 # --- USAGE EXAMPLE ---
 if __name__ == "__main__":
     db = NativeDB()
@@ -1,7 +1,12 @@
 import networkx as nx
 import sqlite3
 import os
+import atexit
+import pickle
+import secrets
 import logging
+import threading
+from concurrent.futures import Future
 from typing import List, Dict, Set, Any
 import json
 
@@ -15,6 +20,31 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DB_PATH = "./data/graph.sqlite"
+# Pickled in-memory graph + adjacency caches; loaded instead of re-hydrating from
+# SQLite when its version matches the DB's write counter.
+SNAPSHOT_PATH = "./data/graph.snap"
+
+# Connection-level tuning: WAL lets commits append to the log instead of
+# fsyncing the main file, and NORMAL sync is durable under WAL.
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+)
+
+# Server-side layout cap: above this many nodes the client lays out (Sigma.js
+# runs ForceAtlas2 in the browser) rather than tying up an API worker.
+# spring_layout still loops over nodes in Python on each of its 50 iterations:
+# ~7.5s at 2000 nodes vs ~46s at 5000, past the frontend's 31s wait.
+LAYOUT_MAX_NODES = 2000
+
+# Community collapsing for large graphs (NodeTrix-style): communities of this size
+# range whose internal edges outnumber their nodes are sent as one matrix node
+COLLAPSE_NODE_LIMIT = 500
+CLUSTER_MIN_SIZE = 8
+CLUSTER_MAX_SIZE = 60
 
 class GraphEngine:
     def __init__(self):
@@ -25,9 +55,40 @@ class GraphEngine:
         """
         os.makedirs("./data", exist_ok=True)
         self.graph = nx.DiGraph()
+        # Undirected 1-hop adjacency (in + out neighbors), kept in sync on writes
+        self._adj: Dict[str, Set[str]] = {}
+        # Integer-indexed mirror of _adj for allocation-light multi-hop BFS
+        self._idx: Dict[str, int] = {}
+        self._inv: List[str] = []
+        self._adj_int: List[List[int]] = []
+        # Per-thread visited bitmap, reused across BFS calls
+        self._bfs_local = threading.local()
+        # Serializes writers (FastAPI runs sync endpoints on a thread pool).
+        # Traversal doesn't take it (it tolerates caches growing mid-walk), and
+        # WAL lets other SQLite connections read while a write is open; readers
+        # that walk the whole NetworkX graph copy it under the lock first.
+        self._write_lock = threading.Lock()
         self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            self.conn.execute(f"PRAGMA {pragma}")
         self._init_db()
-        self._load_graph_from_db()
+        # In-memory mirror of the DB write counter (read lock-free by get_version)
+        self._version = self._db_version()
+        # Random per-database id: a recreated DB restarts the counter at 0, so a
+        # snapshot must match both id and version
+        self._db_id = self._meta_value("db_id")
+        self._snapshot_version = None
+        # ((version, min_size), {id: [x, y]}) for the last computed server-side layout
+        self._layout_cache = None
+        # (version, min_size) -> Future of a layout being computed, so concurrent
+        # callers wait on one computation instead of each starting their own
+        self._layout_inflight: Dict[tuple, Future] = {}
+        self._layout_lock = threading.Lock()
+        # ((version, min_size), data) for the last collapsed node-link payload
+        self._collapsed_cache = None
+        if not self._load_snapshot():
+            self._load_graph_from_db()
+        atexit.register(self.save_snapshot)
 
     def _init_db(self):
         """
@@ -53,6 +114,21 @@ class GraphEngine:
                 PRIMARY KEY (source, target, type)
             )
         """)
+
+        # Write counter, bumped in every write transaction, plus a random id
+        # assigned once per database file (snapshot staleness check)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS graph_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO graph_meta (key, value) VALUES ('version', 0)")
+        cursor.execute("INSERT OR IGNORE INTO graph_meta (key, value) VALUES ('db_id', ?)", (secrets.randbits(63),))
+
+        # Edge lookup indexes. source-side lookups already use the primary
+        # key's leading column; target needs its own btree.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_edges_tgt ON edges(target)")
         self.conn.commit()
 
     def _load_graph_from_db(self):
@@ -64,23 +140,137 @@ class GraphEngine:
         
         # Load Nodes
         cursor.execute("SELECT id, metadata FROM nodes")
-        nodes = cursor.fetchall()
-        for n_id, meta in nodes:
+        node_tuples = []
+        for n_id, meta in cursor.fetchall():
             # Safely handle potential JSON errors
             try:
-                meta_dict = json.loads(meta)
+                meta_dict = json.loads(meta) if meta else {}
             except:
                 meta_dict = {}
-            self.graph.add_node(n_id, **meta_dict)
+            node_tuples.append((n_id, meta_dict))
+        self.graph.add_nodes_from(node_tuples)
+        for n_id, _ in node_tuples:
+            self._intern(n_id)
             
         # Load Edges
         cursor.execute("SELECT source, target, type, weight FROM edges")
         edges = cursor.fetchall()
-        for src, tgt, type_, weight in edges:
-            self.graph.add_edge(src, tgt, type=type_, weight=weight)
+        self.graph.add_edges_from(
+            (src, tgt, {"type": type_, "weight": weight}) for src, tgt, type_, weight in edges
+        )
+        self._index_edges((src, tgt) for src, tgt, _, _ in edges)
             
         logger.info(f"Graph hydrated: {self.graph.number_of_nodes()} nodes, {self.graph.number_of_edges()} edges.")
 
+    def _meta_value(self, key: str):
+        row = self.conn.execute("SELECT value FROM graph_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _db_version(self) -> int:
+        return self._meta_value("version") or 0
+
+    def _bump_version(self):
+        # Must run inside the caller's write transaction
+        self.conn.execute("UPDATE graph_meta SET value = value + 1 WHERE key = 'version'")
+
+    def get_version(self) -> int:
+        """
+        Monotonic write counter; changes whenever nodes or edges are written.
+        """
+        return self._version
+
+    def _load_snapshot(self) -> bool:
+        """
+        Restores memory state from SNAPSHOT_PATH.
+        Returns False (caller hydrates from SQLite) if missing, unreadable, stale,
+        or written for a different database.
+        """
+        if not os.path.exists(SNAPSHOT_PATH):
+            return False
+        try:
+            with open(SNAPSHOT_PATH, "rb") as f:
+                snap = pickle.load(f)
+            if snap.get("db_id") != self._db_id or snap.get("version") != self._version:
+                logger.info("Graph snapshot is stale, falling back to SQLite.")
+                return False
+            state = (snap["graph"], snap["adj"], snap["idx"], snap["inv"], snap["adj_int"])
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable graph snapshot: {e}")
+            return False
+
+        self.graph, self._adj, self._idx, self._inv, self._adj_int = state
+        self._snapshot_version = self._version
+        logger.info(f"Graph loaded from snapshot: {self.graph.number_of_nodes()} nodes, {self.graph.number_of_edges()} edges.")
+        return True
+
+    def save_snapshot(self):
+        """
+        Writes the in-memory graph to SNAPSHOT_PATH (atomically) if it changed.
+        Called at interpreter exit; safe to call manually.
+        """
+        with self._write_lock:
+            version = self._version
+            if version == self._snapshot_version:
+                return
+            snap = {
+                "db_id": self._db_id,
+                "version": version,
+                "graph": self.graph,
+                "adj": self._adj,
+                "idx": self._idx,
+                "inv": self._inv,
+                "adj_int": self._adj_int,
+            }
+            tmp_path = SNAPSHOT_PATH + ".tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(snap, f, protocol=5)
+                os.replace(tmp_path, SNAPSHOT_PATH)
+                self._snapshot_version = version
+                logger.info(f"Graph snapshot saved (version {version}).")
+            except Exception as e:
+                logger.warning(f"Graph snapshot not saved: {e}")
+
+    def _intern(self, node_id: str) -> int:
+        """
+        Returns the stable integer index for a node, assigning one if new.
+        """
+        idx = self._idx.get(node_id)
+        if idx is None:
+            idx = len(self._inv)
+            self._idx[node_id] = idx
+            self._inv.append(node_id)
+            self._adj_int.append([])
+        return idx
+
+    def _index_edges(self, pairs):
+        """
+        Records (source, target) pairs in the undirected adjacency caches.
+        """
+        adj = self._adj
+        adj_int = self._adj_int
+        for src, tgt in pairs:
+            src_adj = adj.setdefault(src, set())
+            if tgt in src_adj:
+                continue  # pair already indexed (other direction or edge type)
+            src_adj.add(tgt)
+            adj.setdefault(tgt, set()).add(src)
+
+            s, t = self._intern(src), self._intern(tgt)
+            adj_int[s].append(t)
+            if s != t:
+                adj_int[t].append(s)
+
+    def _visited_buffer(self) -> bytearray:
+        """
+        Returns this thread's zeroed visited bitmap, grown to fit all nodes.
+        """
+        buf = getattr(self._bfs_local, "visited", None)
+        if buf is None or len(buf) < len(self._inv):
+            buf = bytearray(2 * len(self._inv))
+            self._bfs_local.visited = buf
+        return buf
+
     def add_nodes(self, nodes: List[NodeCreate]):
         """
         Persist nodes to SQLite and update memory.
@@ -88,17 +278,22 @@ class GraphEngine:
         if not nodes:
             return
 
-        cursor = self.conn.cursor()
-        for node in nodes:
-            # 1. Update In-Memory Graph
-            self.graph.add_node(node.id, **node.metadata)
-            
-            # 2. Persist to SQLite
-            cursor.execute(
-                "INSERT OR REPLACE INTO nodes (id, metadata) VALUES (?, ?)",
-                (node.id, json.dumps(node.metadata))
-            )
-        self.conn.commit()
+        with self._write_lock:
+            # 1. Persist to SQLite (single transaction, one bulk statement)
+            rows = [(node.id, json.dumps(node.metadata)) for node in nodes]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO nodes (id, metadata) VALUES (?, ?)",
+                    rows
+                )
+                self._bump_version()
+
+            # 2. Update In-Memory Graph (only once the commit succeeded, so a
+            # failed write never reaches memory or a later snapshot)
+            self.graph.add_nodes_from((node.id, node.metadata) for node in nodes)
+            for node in nodes:
+                self._intern(node.id)
+            self._version += 1
         logger.info(f"Added {len(nodes)} nodes to Graph.")
 
     def add_edges(self, edges: List[EdgeCreate]):
@@ -108,17 +303,23 @@ class GraphEngine:
         if not edges:
             return
 
-        cursor = self.conn.cursor()
-        for edge in edges:
-            # 1. Update In-Memory Graph
-            self.graph.add_edge(edge.source, edge.target, type=edge.type, weight=edge.weight)
-            
-            # 2. Persist to SQLite
-            cursor.execute(
-                "INSERT OR REPLACE INTO edges (source, target, type, weight) VALUES (?, ?, ?, ?)",
-                (edge.source, edge.target, edge.type, edge.weight)
+        with self._write_lock:
+            # 1. Persist to SQLite (single transaction, one bulk statement)
+            rows = [(edge.source, edge.target, edge.type, edge.weight) for edge in edges]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO edges (source, target, type, weight) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._bump_version()
+
+            # 2. Update In-Memory Graph (after commit, as in add_nodes)
+            self.graph.add_edges_from(
+                (edge.source, edge.target, {"type": edge.type, "weight": edge.weight})
+                for edge in edges
             )
-        self.conn.commit()
+            self._index_edges((edge.source, edge.target) for edge in edges)
+            self._version += 1
         logger.info(f"Added {len(edges)} edges to Graph.")
 
     def get_neighbors(self, node_id: str, depth: int = 1) -> List[str]:
@@ -129,25 +330,178 @@ class GraphEngine:
             return []
             
         if depth == 1:
-            # Look both ways! (Successors = Outgoing, Predecessors = Incoming)
-            outgoing = list(self.graph.successors(node_id))
-            incoming = list(self.graph.predecessors(node_id))
-            return list(set(outgoing + incoming))
+            # Look both ways! (cached Successors + Predecessors)
+            return list(self._adj.get(node_id, ()))
         
-        # BFS for deeper hops (convert to undirected temporarily for traversal)
-        undirected_view = self.graph.to_undirected()
-        paths = nx.single_source_shortest_path_length(undirected_view, node_id, cutoff=depth)
-        return [n for n in paths.keys() if n != node_id]
+        # Level-by-level BFS over integer indices (no graph copy per call)
+        start = self._idx.get(node_id)
+        if start is None:
+            return []
+
+        adj_int = self._adj_int
+        visited = self._visited_buffer()
+        # Nodes interned by a concurrent writer after the buffer was sized may
+        # show up in adj_int mid-walk; they're newer than this call, so skip them
+        size = len(visited)
+        visited[start] = 1
+        reached = [start]
+        frontier = [start]
+        level = 0
+        while frontier and level < depth:
+            next_frontier = []
+            for v in frontier:
+                for n in adj_int[v]:
+                    if n < size and not visited[n]:
+                        visited[n] = 1
+                        next_frontier.append(n)
+            reached.extend(next_frontier)
+            frontier = next_frontier
+            level += 1
+
+        # Reset only the bits we touched so the buffer is clean for the next call
+        for i in reached:
+            visited[i] = 0
+
+        inv = self._inv
+        return [inv[i] for i in reached[1:]]
 
     def get_subgraph_json(self):
         """
         Returns graph data compatible with visualization libraries (e.g., Pyvis/Streamlit).
         Ensures the key 'links' is present instead of 'edges'.
         """
-        data = nx.node_link_data(self.graph)
+        # node_link_data walks the graph in Python; copy under the lock so a
+        # concurrent ingest can't resize it mid-iteration
+        with self._write_lock:
+            graph = self.graph.copy()
+        return self._node_link_json(graph)
+
+    @staticmethod
+    def _node_link_json(graph) -> Dict[str, Any]:
+        data = nx.node_link_data(graph)
         
         # FIX: Rename 'edges' to 'links' to satisfy Test Case & D3 Standard
         if "edges" in data:
             data["links"] = data.pop("edges")
             
-        return data
\ No newline at end of file
+        return data
+
+    def get_layout(self, min_size: int = 0) -> Dict[str, List[float]]:
+        """
+        Force-directed positions for every node, normalized to [-1, 1]
+        (empty above LAYOUT_MAX_NODES).
+        Computed once per graph version, so repeat views don't pay for it.
+        min_size > 0 lays out the get_collapsed_json(min_size) graph instead,
+        so cluster nodes get positions too.
+        """
+        key = (self._version, min_size)
+        with self._layout_lock:
+            cached = self._layout_cache
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            future = self._layout_inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._layout_inflight[key] = Future()
+
+        if not owner:
+            return future.result()
+        try:
+            layout = self._compute_layout(min_size)
+            future.set_result(layout)
+            return layout
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._layout_lock:
+                self._layout_inflight.pop(key, None)
+
+    def _compute_layout(self, min_size: int) -> Dict[str, List[float]]:
+        key = (self._version, min_size)
+        if min_size > 0:
+            # Rebuilt from the (already snapshotted) collapsed payload; no lock needed
+            data = self.get_collapsed_json(min_size)
+            graph = nx.DiGraph()
+            graph.add_nodes_from(node["id"] for node in data["nodes"])
+            graph.add_edges_from((link["source"], link["target"]) for link in data["links"])
+        else:
+            # Copy under the lock so a concurrent ingest can't resize the graph mid-layout
+            with self._write_lock:
+                key = (self._version, min_size)
+                graph = self.graph.copy()
+
+        # Fruchterman-Reingold: spring_layout switches to its sparse solver above
+        # 500 nodes, so memory stays O(N + E) (the dense forceatlas2_layout
+        # allocates N x N x 2 per iteration)
+        if 0 < len(graph) <= LAYOUT_MAX_NODES:
+            pos = nx.spring_layout(graph, seed=42)
+        else:
+            pos = {}
+
+        extent = max((max(abs(x), abs(y)) for x, y in pos.values()), default=0) or 1.0
+        layout = {node: [float(x) / extent, float(y) / extent] for node, (x, y) in pos.items()}
+        with self._layout_lock:
+            self._layout_cache = (key, layout)
+        return layout
+
+    def get_collapsed_json(self, min_size: int = CLUSTER_MIN_SIZE) -> Dict[str, Any]:
+        """
+        Like get_subgraph_json, but for graphs over COLLAPSE_NODE_LIMIT nodes each dense
+        Louvain community becomes one {"kind": "matrix", "nodes", "adjacency"} node.
+        Its internal edges are dropped (adjacency holds them as [i, j] index pairs) and
+        edges leaving it are merged into one weighted meta-edge per neighbor.
+        """
+        key = (self._version, min_size)
+        cached = self._collapsed_cache
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        with self._write_lock:
+            key = (self._version, min_size)
+            graph = self.graph.copy()
+
+        if len(graph) <= COLLAPSE_NODE_LIMIT:
+            data = self._node_link_json(graph)
+            self._collapsed_cache = (key, data)
+            return data
+
+        # --- CLUSTER ---
+        owner = {}
+        clusters = []
+        for members in nx.community.louvain_communities(graph.to_undirected(as_view=True), seed=42):
+            if not min_size <= len(members) <= CLUSTER_MAX_SIZE:
+                continue
+            sub = graph.subgraph(members)
+            if sub.number_of_edges() <= len(members):
+                continue  # sparse: a matrix wouldn't save any primitives
+            order = sorted(members)
+            pos = {node: i for i, node in enumerate(order)}
+            cluster_id = f"cluster:{len(clusters)}"
+            clusters.append({
+                "id": cluster_id,
+                "kind": "matrix",
+                "nodes": order,
+                "adjacency": [[pos[u], pos[v]] for u, v in sub.edges()],
+            })
+            owner.update(dict.fromkeys(members, cluster_id))
+
+        # --- REWIRE EDGES ---
+        links = []
+        meta = {}
+        for u, v, attrs in graph.edges(data=True):
+            su, sv = owner.get(u, u), owner.get(v, v)
+            if su == u and sv == v:
+                links.append({**attrs, "source": u, "target": v})
+            elif su != sv:
+                meta[(su, sv)] = meta.get((su, sv), 0) + 1
+        links.extend(
+            {"source": s, "target": t, "type": f"{count} links", "weight": count}
+            for (s, t), count in meta.items()
+        )
+
+        nodes = [{**attrs, "id": node} for node, attrs in graph.nodes(data=True) if node not in owner]
+        data = {"directed": True, "multigraph": False, "graph": {}, "nodes": nodes + clusters, "links": links}
+        logger.info(f"Collapsed {len(owner)} nodes into {len(clusters)} matrix clusters.")
+        self._collapsed_cache = (key, data)
+        return data
@@ -1,4 +1,6 @@
-from typing import List, Dict, Any
+from collections import defaultdict
+import numpy as np
+from typing import List, Any
 from .vector_engine import VectorEngine
 from .graph_engine import GraphEngine
 
@@ -19,63 +21,62 @@ class HybridEngine:
         # Get more than k (e.g., k*2) to allow graph connections to bubble up
         vector_results = self.vec.search(query, limit=top_k * 2)
         
-        # Normalize Vector Scores to 0-1 range (heuristic)
-        # LanceDB is already cosine (0-1), but let's ensure it.
-        # Map: {node_id: score}
-        scores: Dict[str, float] = {}
-        for res in vector_results:
-            scores[res['id']] = res['score'] * vector_weight
-
         # --- STEP 2: Graph Expansion (The "Context") ---
-        # For every high-ranking vector result, find its neighbors
-        # and give them a "Graph Boost"
-        
-        graph_boosts = {}
+        # Single pass: record each anchor's vector score and, for every
+        # neighbor, accumulate a "Graph Boost".
+        # Map: {node_id: [weighted vector score, raw graph boost]}
+        candidates = defaultdict(lambda: [0.0, 0.0])
         
         for v_res in vector_results:
             node_id = v_res['id']
-            # Get neighbors (1 hop)
-            neighbors = self.graph.get_neighbors(node_id, depth=1)
+            # LanceDB is already cosine (0-1)
+            candidates[node_id][0] = v_res['score'] * vector_weight
+
+            # Simple decay: Immediate neighbor gets 0.3 * parent_score
+            boost = 0.3 * v_res['score']
             
-            for neighbor in neighbors:
-                # If neighbor was already found by vector, boost it.
-                # If it wasn't, add it as a new candidate.
-                
-                # Simple decay: Immediate neighbor gets 0.5 * parent_score
-                boost = 0.3 * v_res['score'] 
-                
-                if neighbor in graph_boosts:
-                    graph_boosts[neighbor] += boost
-                else:
-                    graph_boosts[neighbor] = boost
+            # If neighbor was already found by vector, boost it.
+            # If it wasn't, add it as a new candidate.
+            for neighbor in self.graph.get_neighbors(node_id, depth=1):
+                candidates[neighbor][1] += boost
 
         # --- STEP 3: Merge & Formula ---
         # Final Score = (Vector Score * v_weight) + (Graph Score * g_weight)
-        
-        final_candidates = {}
-        all_ids = set(scores.keys()) | set(graph_boosts.keys())
-        
-        for nid in all_ids:
-            v_score = scores.get(nid, 0.0)
-            
-            # Normalize graph boost (simple heuristic for hackathon)
-            # We cap graph score at 1.0 to prevent explosion
-            g_raw = graph_boosts.get(nid, 0.0)
-            g_score = min(g_raw, 1.0) * graph_weight
-            
-            final_score = v_score + g_score
-            
+        # Computed for all candidates at once in NumPy.
+        if not candidates or top_k <= 0:
+            return []
+
+        ids = list(candidates.keys())
+        pairs = np.fromiter(
+            (x for pair in candidates.values() for x in pair),
+            dtype=np.float64,
+            count=2 * len(ids)
+        ).reshape(-1, 2)
+        v_scores = pairs[:, 0]
+        # Normalize graph boost (simple heuristic for hackathon)
+        # We cap graph score at 1.0 to prevent explosion
+        g_scores = np.minimum(pairs[:, 1], 1.0) * graph_weight
+        final_scores = v_scores + g_scores
+
+        # --- STEP 4: Top-K & Format ---
+        # Partial selection, then sort only the k winners
+        k = min(top_k, len(ids))
+        top_idx = np.argpartition(-final_scores, k - 1)[:k]
+        top_idx = top_idx[np.argsort(-final_scores[top_idx], kind="stable")]
+
+        results = []
+        for i in top_idx:
+            v_score = v_scores[i]
+            g_score = g_scores[i]
+
             reason = []
             if v_score > 0: reason.append(f"Vector({v_score:.2f})")
             if g_score > 0: reason.append(f"GraphNeighbor({g_score:.2f})")
-            
-            final_candidates[nid] = {
-                "id": nid,
-                "score": final_score,
+
+            results.append({
+                "id": ids[i],
+                "score": float(final_scores[i]),
                 "reason": " + ".join(reason)
-            }
+            })
 
-        # --- STEP 4: Sort & Format ---
-        sorted_results = sorted(final_candidates.values(), key=lambda x: x['score'], reverse=True)
-        
-        return sorted_results[:top_k]
\ No newline at end of file
+        return results
@@ -36,6 +36,17 @@ except Exception as e:
 
 import spacy
 
+# Precompiled patterns / lookup sets used in the extraction hot loop
+_PAREN = re.compile(r'\(.*?\)')
+_BRACK = re.compile(r'\[.*?\]')
+_DET = re.compile(r'^(?:The|A|An)\s+', re.IGNORECASE)
+_WS = re.compile(r'\s+')
+_TAG = re.compile(r'<[^>]+>')
+_SKIP_LABELS = frozenset({"CARDINAL", "DATE", "TIME", "PERCENT", "QUANTITY", "ORDINAL"})
+_STOP = frozenset({"it", "he", "she", "they", "this", "that", "one", "who", "which"})
+
+SPACY_BATCH_SIZE = 32
+
 # --- 3. HANDLER INTERFACES ---
 
 class Handler:
@@ -66,7 +77,7 @@ class HTMLHandler(Handler):
             extracted = trafilatura.extract(text)
             return extracted if extracted else text
         else:
-            return re.sub(r'<[^>]+>', '', text)
+            return _TAG.sub('', text)
 
 class JSONHandler(Handler):
     name = "json"
@@ -116,30 +127,43 @@ class IngestionPipeline:
         # 2. Aggressive Cleaning
         text = fix_text(text)
         # Remove citations like [1], [citation needed]
-        text = re.sub(r'\[.*?\]', '', text)
+        text = _BRACK.sub('', text)
         # Remove parentheses content just for cleaner graph nodes? 
         # Actually better to keep them in text but clean them in extraction.
         
-        text = " ".join(text.split()) 
+        # Collapse whitespace runs in a single C-level regex pass
+        text = _WS.sub(' ', text).strip()
         return text
 
     def extract_structured_data(self, text: str) -> Tuple[List[NodeCreate], List[EdgeCreate]]:
         cleaned_text = self.preprocess(text)
         doc = self.nlp(cleaned_text)
-
+        return self._extract_from_doc(doc)
+
+    def extract_structured_data_many(self, texts: List[str]) -> List[Tuple[List[NodeCreate], List[EdgeCreate]]]:
+        """
+        Batch variant: streams all documents through nlp.pipe in one go.
+        Every pipeline component is kept: relation extraction reads pos_/dep_/lemma_,
+        and pos_ comes from the attribute_ruler (tagger -> attribute_ruler -> lemmatizer).
+        """
+        cleaned_texts = [self.preprocess(t) for t in texts]
+        docs = self.nlp.pipe(cleaned_texts, batch_size=SPACY_BATCH_SIZE)
+        return [self._extract_from_doc(doc) for doc in docs]
+
+    def _extract_from_doc(self, doc) -> Tuple[List[NodeCreate], List[EdgeCreate]]:
         nodes: Dict[str, NodeCreate] = {}
         edges = []
 
         # Helper to clean node IDs
         def clean_node_id(text):
             # Remove (stuff), [stuff], and extra spaces
-            text = re.sub(r'\(.*?\)', '', text)
-            text = re.sub(r'\[.*?\]', '', text)
+            text = _PAREN.sub('', text)
+            text = _BRACK.sub('', text)
             return text.strip()
 
         # --- NER (Nodes) ---
         for ent in doc.ents:
-            if ent.label_ in ["CARDINAL", "DATE", "TIME", "PERCENT", "QUANTITY", "ORDINAL"]:
+            if ent.label_ in _SKIP_LABELS:
                 continue
             
             e_text = clean_node_id(ent.text)
@@ -194,15 +218,14 @@ class IngestionPipeline:
                         o_text = clean_node_id(o_token.text)
                         
                         # Remove determiners
-                        s_text = re.sub(r'^(The|A|An)\s+', '', s_text, flags=re.IGNORECASE)
-                        o_text = re.sub(r'^(The|A|An)\s+', '', o_text, flags=re.IGNORECASE)
+                        s_text = _DET.sub('', s_text)
+                        o_text = _DET.sub('', o_text)
 
                         # Strict Filters
                         if len(s_text) < 2 or len(o_text) < 2: continue
                         
                         # BLOCK PRONOUNS / GENERIC WORDS
-                        stop_concepts = ["it", "he", "she", "they", "this", "that", "one", "who", "which"]
-                        if s_text.lower() in stop_concepts or o_text.lower() in stop_concepts:
+                        if s_text.lower() in _STOP or o_text.lower() in _STOP:
                             continue
 
                         # Register Nodes
@@ -1,8 +1,12 @@
 import uvicorn
 import logging
-from fastapi import FastAPI, HTTPException
+import json
+import uuid
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field, ValidationError
 from typing import Dict, Any, List, Optional
 
 # Import your core logic (NativeDB from core.py)
@@ -15,6 +19,16 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("API")
 
+# Optional: MessagePack encoding for /graph (JSON is served when missing)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    logger.warning("msgpack not found. /graph will only be served as JSON.")
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
 # Initialize FastAPI App
 app = FastAPI(
     title="Vector+Graph Native Database",
@@ -31,10 +45,24 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Compress larger responses (/graph, /search, /batch) for clients sending
+# Accept-Encoding: gzip. Node-link JSON is repetitive and shrinks several-fold;
+# small bodies aren't worth the CPU. Level 5 keeps big graphs cheap to encode.
+app.add_middleware(GZipMiddleware, minimum_size=4096, compresslevel=5)
+
 # Instantiate the Database Engine ONCE
 # This loads the heavy ML models into memory at startup
 db = NativeDB()
 
+# Prefixed onto graph ETags so a recreated DB (counter restarting at 0)
+# never matches a tag cached before this process started
+BOOT_ID = uuid.uuid4().hex[:8]
+
+def graph_etag(collapse: int = 0) -> str:
+    # Collapsed and full payloads of the same version are different representations
+    suffix = f"-c{collapse}" if collapse > 0 else ""
+    return f'"{BOOT_ID}-{db.get_graph_version()}{suffix}"'
+
 # --- Pydantic Models (Validation) ---
 
 class IngestRequest(BaseModel):
@@ -46,6 +74,13 @@ class SearchRequest(BaseModel):
     top_k: int = Field(5, description="Number of results to return")
     mode: str = Field("hybrid", description="Search mode: 'vector', 'graph', or 'hybrid'")
 
+class BatchOp(BaseModel):
+    name: str = Field(..., description="Operation: 'search', 'ingest', 'graph', 'layout', 'version' or 'health'")
+    body: Dict[str, Any] = Field(default_factory=dict, description="Request body for that operation")
+
+class BatchRequest(BaseModel):
+    ops: List[BatchOp] = Field(..., description="Operations to run, in order")
+
 # --- API Endpoints ---
 
 @app.get("/")
@@ -92,17 +127,128 @@ def search_data(payload: SearchRequest):
         logger.error(f"Search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/search/stream")
+def search_stream(payload: SearchRequest):
+    """
+    Streaming Search Endpoint:
+    Same ranking as /search, sent as NDJSON: a {"count", "mode"} header line,
+    then one line per hit in rank order, so the UI can paint hits as they land.
+    """
+    try:
+        results = db.search(payload.query, mode=payload.mode, top_k=payload.top_k)
+    except Exception as e:
+        logger.error(f"Search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def lines():
+        yield json.dumps({"count": len(results), "mode": payload.mode}) + "\n"
+        for hit in results:
+            yield json.dumps(hit) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/graph")
-def get_graph():
+def get_graph(request: Request, collapse: int = 0):
     """
     Visualization Endpoint:
     Returns the full graph structure (nodes/links) for the frontend to render.
+    Sends an ETag; answers 304 with no body when If-None-Match still matches.
+    Clients that send Accept: application/msgpack get a MessagePack body instead.
+    ?collapse=K folds dense communities of K+ nodes into matrix nodes on large graphs.
     """
     try:
-        return db.get_graph_viz()
+        etag = graph_etag(collapse)
+        # Same URL, two encodings: caches must key on Accept too
+        headers = {"ETag": etag, "Vary": "Accept"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        if MSGPACK_AVAILABLE and MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+            body = msgpack.packb(db.get_graph_viz(collapse), use_bin_type=True)
+            return Response(body, media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+        return JSONResponse(db.get_graph_viz(collapse), headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/graph/version")
+def get_graph_version(collapse: int = 0):
+    """
+    Version Endpoint:
+    The current /graph ETag without the body, so a client holding a cached
+    copy can check it for the price of a tiny response.
+    """
+    return {"etag": graph_etag(collapse), "version": db.get_graph_version()}
+
+@app.get("/graph/layout")
+def get_graph_layout(request: Request, collapse: int = 0):
+    """
+    Layout Endpoint:
+    Returns {node_id: [x, y]} computed server-side (cached per graph version).
+    Shares the /graph ETag, so the client can tell which graph it belongs to;
+    pass the same ?collapse=K as /graph to get positions for its cluster nodes.
+    """
+    try:
+        etag = graph_etag(collapse)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return JSONResponse(db.get_graph_layout(collapse), headers={"ETag": etag})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def graph_op(body: Dict[str, Any]):
+    """
+    /batch flavour of /graph: {"etag": ..., "collapse": K} in, {"etag", "graph"} out,
+    with graph=None when the client's copy is still current.
+    """
+    collapse = int(body.get("collapse", 0))
+    etag = graph_etag(collapse)
+    if body.get("etag") == etag:
+        return {"etag": etag, "graph": None}
+    return {"etag": etag, "graph": db.get_graph_viz(collapse)}
+
+def layout_op(body: Dict[str, Any]):
+    """
+    /batch flavour of /graph/layout, same etag/collapse handshake as graph_op.
+    """
+    collapse = int(body.get("collapse", 0))
+    etag = graph_etag(collapse)
+    if body.get("etag") == etag:
+        return {"etag": etag, "layout": None}
+    return {"etag": etag, "layout": db.get_graph_layout(collapse)}
+
+# Operations reachable through /batch (dispatched in-process)
+BATCH_OPS = {
+    "search": lambda body: search_data(SearchRequest(**body)),
+    "ingest": lambda body: ingest_data(IngestRequest(**body)),
+    "graph": graph_op,
+    "layout": layout_op,
+    "version": lambda body: get_graph_version(int(body.get("collapse", 0))),
+    "health": lambda body: health_check(),
+}
+
+@app.post("/batch")
+def run_batch(payload: BatchRequest):
+    """
+    Batch Endpoint:
+    Runs several operations from one HTTP request, in order, and returns
+    their results in the same order (one round trip instead of N).
+    """
+    results = []
+    for op in payload.ops:
+        handler = BATCH_OPS.get(op.name)
+        if handler is None:
+            results.append({"status": 400, "detail": f"Unknown operation '{op.name}'"})
+            continue
+        try:
+            results.append({"status": 200, "body": handler(op.body)})
+        except HTTPException as e:
+            results.append({"status": e.status_code, "detail": e.detail})
+        except ValidationError as e:
+            results.append({"status": 422, "detail": str(e)})
+        except Exception as e:
+            logger.error(f"Batch op '{op.name}' failed: {e}")
+            results.append({"status": 500, "detail": str(e)})
+    return {"results": results}
+
 # --- Server Runner ---
 if __name__ == "__main__":
     # Runs the server on localhost:8000 with auto-reload enabled
@@ -1,8 +1,14 @@
 import lancedb
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any, Optional
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import copy
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import math
 import os
 import json  # <--- NEW IMPORT
 
@@ -19,74 +25,232 @@ logger = logging.getLogger(__name__)
 DB_PATH = "./data/lancedb_store" 
 TABLE_NAME = "nodes"
 MODEL_NAME = 'all-MiniLM-L6-v2' 
+EMBED_BATCH_SIZE = 64
+QUERY_CACHE_SIZE = 1024
+# Parallel embedding for large ingests (1 = encode on the calling thread)
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", "1"))
+# Scalar-quantized (int8 codes) ANN index; only worth training past a few hundred rows
+VECTOR_INDEX_TYPE = "IVF_HNSW_SQ"
+VECTOR_INDEX_MIN_ROWS = 256
+# Rebuild once this share of the table was added after the last build (those rows are brute-forced)
+VECTOR_INDEX_REBUILD_FRACTION = 0.2
+# Query-side recall: probe a tenth of the IVF partitions (at least this many),
+# then re-rank refine_factor * limit candidates on the full float32 vectors
+VECTOR_MIN_NPROBES = 20
+VECTOR_REFINE_FACTOR = 5
+# All embeddings are L2-normalized, so squared L2 ranks like cosine without the
+# per-row norms: ||a - b||^2 = 2 - 2 * dot(a, b)
+VECTOR_METRIC = "l2"
 
 class VectorEngine:
     def __init__(self):
         os.makedirs(DB_PATH, exist_ok=True)
         logger.info(f"Loading embedding model: {MODEL_NAME}...")
         self.model = SentenceTransformer(MODEL_NAME, device='cpu')
+        # Per-instance LRU of query text -> embedding (tuple, so cached values stay immutable)
+        self._embed_query = functools.lru_cache(maxsize=QUERY_CACHE_SIZE)(
+            lambda text: tuple(self.embed_text(text))
+        )
+        self._worker_local = threading.local()
+        self._pool = self._make_pool() if EMBED_WORKERS > 1 else None
         logger.info(f"Connecting to LanceDB at {DB_PATH}...")
         self.db = lancedb.connect(DB_PATH)
         self.table = None
+        self._indexed = False
+        # Table size at the last index build, and the partition count it used
+        self._index_rows = 0
+        self._num_partitions = 0
+        # After a failed build, don't try again until the table reaches this size
+        self._index_retry_rows = VECTOR_INDEX_MIN_ROWS
+        # Held for the duration of a (background) index build; at most one at a time
+        self._index_lock = threading.Lock()
         self._init_table()
 
     def _init_table(self):
         if TABLE_NAME in self.db.table_names():
             self.table = self.db.open_table(TABLE_NAME)
+            self._indexed = self._has_vector_index()
+            if self._indexed:
+                # Exact build size isn't stored; assume the index is current and
+                # let the rebuild threshold catch up from here
+                self._index_rows = self.table.count_rows()
+                self._num_partitions = self._partitions_for(self._index_rows)
             logger.info(f"Vector Table '{TABLE_NAME}' opened.")
         else:
             logger.info(f"Vector Table '{TABLE_NAME}' ready for first insert.")
 
+    def _has_vector_index(self) -> bool:
+        try:
+            return any("vector" in idx.columns for idx in self.table.list_indices())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _partitions_for(rows: int) -> int:
+        # ~sqrt(N) IVF partitions keeps lists around sqrt(N) rows each
+        return max(1, int(math.sqrt(rows)))
+
+    def _maybe_build_index(self):
+        """
+        Builds the int8 scalar-quantized vector index once the table is big enough,
+        and rebuilds it (re-partitioned for the new size) once rows added since the
+        last build pass VECTOR_INDEX_REBUILD_FRACTION of the table, since until then
+        they are searched flat. A failed build waits for the table to double.
+
+        The build runs on a background thread so ingests return once rows are
+        written; while one is running, further checks are skipped (the next
+        add_nodes after it finishes re-checks).
+        """
+        if not self._index_lock.acquire(blocking=False):
+            return
+        try:
+            rows = self.table.count_rows()
+            due = rows >= self._index_retry_rows and not (
+                self._indexed and (rows - self._index_rows) < VECTOR_INDEX_REBUILD_FRACTION * rows
+            )
+            if due:
+                threading.Thread(target=self._build_index, args=(rows,), name="vector-index", daemon=True).start()
+        except Exception:
+            self._index_lock.release()
+            raise
+        if not due:
+            self._index_lock.release()
+
+    def _build_index(self, rows: int):
+        # Runs on the build thread; owns _index_lock until done
+        num_partitions = self._partitions_for(rows)
+        try:
+            self.table.create_index(
+                metric=VECTOR_METRIC,
+                vector_column_name="vector",
+                index_type=VECTOR_INDEX_TYPE,
+                num_partitions=num_partitions,
+                replace=True
+            )
+            # Updated before the lock is released, so the next check sees the new build
+            self._num_partitions = num_partitions
+            self._index_rows = rows
+            self._indexed = True
+            logger.info(f"Built {VECTOR_INDEX_TYPE} vector index on '{TABLE_NAME}' ({rows} rows, {num_partitions} partitions).")
+        except Exception as e:
+            self._index_retry_rows = rows * 2
+            logger.warning(f"Vector index build failed at {rows} rows, retrying at {self._index_retry_rows}: {e}")
+        finally:
+            self._index_lock.release()
+
     def embed_text(self, text: str) -> List[float]:
-        return self.model.encode(text).tolist()
+        return self.model.encode(text, convert_to_numpy=True, normalize_embeddings=True).tolist()
+
+    def set_model(self, model: SentenceTransformer):
+        """
+        Hot-swaps the embedding model and drops query embeddings from the old one.
+        """
+        self.model = model
+        self._embed_query.cache_clear()
+        if self._pool is not None:
+            # Workers hold copies of the old model; restart them
+            self._pool.shutdown(wait=True)
+            self._pool = self._make_pool()
+
+    def _make_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=EMBED_WORKERS,
+            initializer=self._init_worker,
+            thread_name_prefix="embed"
+        )
+
+    def _init_worker(self):
+        # Each worker gets its own model copy: HF fast tokenizers can't be shared across threads
+        self._worker_local.model = copy.deepcopy(self.model)
+
+    def _encode_chunk(self, texts: List[str]):
+        return self._encode(self._worker_local.model, texts)
+
+    @staticmethod
+    def _encode(model: SentenceTransformer, texts: List[str]):
+        return model.encode(
+            texts,
+            batch_size=EMBED_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    def embed_batch(self, texts: List[str]):
+        """
+        Encodes many texts in one call so the model runs batched forward passes.
+        With EMBED_WORKERS > 1, large inputs are split into batches encoded concurrently.
+        """
+        if self._pool is None or len(texts) <= EMBED_BATCH_SIZE:
+            return self._encode(self.model, texts)
+
+        chunks = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        return np.concatenate(list(self._pool.map(self._encode_chunk, chunks)))
 
     def add_nodes(self, nodes: List[NodeCreate]):
         if not nodes: return
 
-        data_to_insert = []
         logger.info(f"Embedding {len(nodes)} nodes...")
-        
-        for node in nodes:
-            vector = self.embed_text(node.text)
-            row = {
-                "id": node.id,
-                "text": node.text,
-                "vector": vector,
-                "label": node.metadata.get("label", "CONCEPT"),
-                # FIX: Serialize dict to JSON string safely
-                "metadata": json.dumps(node.metadata) 
-            }
-            data_to_insert.append(row)
+        texts = [node.text for node in nodes]
+        vectors = np.asarray(self.embed_batch(texts), dtype=np.float32)
+        dim = vectors.shape[1]
+
+        # Build one columnar Arrow table; vectors go in as a fixed-size float32 list
+        data_to_insert = pa.table({
+            "id": [node.id for node in nodes],
+            "text": texts,
+            "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), dim),
+            "label": [node.metadata.get("label", "CONCEPT") for node in nodes],
+            # FIX: Serialize dict to JSON string safely
+            "metadata": [json.dumps(node.metadata) for node in nodes]
+        })
 
         if self.table is None:
             self.table = self.db.create_table(TABLE_NAME, data=data_to_insert)
         else:
             self.table.add(data_to_insert)
+        self._maybe_build_index()
             
         logger.info(f"Stored {len(nodes)} nodes in Vector DB.")
 
-    def search(self, query_text: str, limit: int = 5) -> List[Dict]:
+    def search(self, query_text: str, limit: int = 5, include_metadata: bool = False) -> List[Dict]:
+        """
+        Similarity search over node embeddings (score = cosine similarity).
+        Metadata is only fetched and decoded when include_metadata is set;
+        hybrid ranking only needs id + score.
+        """
         if self.table is None: return []
 
-        query_vector = self.embed_text(query_text)
-        results = self.table.search(query_vector).metric("cosine").limit(limit).to_pandas()
+        columns = ["id", "text", "metadata"] if include_metadata else ["id", "text"]
+        query_vector = list(self._embed_query(query_text))
+        query = self.table.search(query_vector).metric(VECTOR_METRIC)
+        if self._indexed:
+            query = (
+                query.nprobes(max(VECTOR_MIN_NPROBES, self._num_partitions // 10))
+                .refine_factor(VECTOR_REFINE_FACTOR)
+            )
+        results = (
+            query
+            .select(columns)
+            .limit(limit)
+            .to_arrow()
+        )
 
-        formatted_results = []
-        for _, row in results.iterrows():
-            similarity = 1 - row["_distance"]
-            
-            # FIX: Deserialize JSON string back to dict
-            meta_str = row.get("metadata", "{}")
-            try:
-                meta_dict = json.loads(meta_str) if isinstance(meta_str, str) else meta_str
-            except:
-                meta_dict = {}
-
-            formatted_results.append({
-                "id": row["id"],
-                "text": row["text"],
-                "score": float(similarity),
-                "metadata": meta_dict
-            })
+        # Columnar extraction instead of per-row DataFrame iteration
+        ids = results["id"].to_pylist()
+        texts = results["text"].to_pylist()
+        distances = results["_distance"].to_pylist()
+        formatted_results = [
+            {"id": i, "text": t, "score": float(1 - d / 2)}
+            for i, t, d in zip(ids, texts, distances)
+        ]
+
+        if include_metadata:
+            for item, meta_str in zip(formatted_results, results["metadata"].to_pylist()):
+                # FIX: Deserialize JSON string back to dict
+                try:
+                    item["metadata"] = json.loads(meta_str) if isinstance(meta_str, str) else (meta_str or {})
+                except:
+                    item["metadata"] = {}
             
         return formatted_results
\ No newline at end of file
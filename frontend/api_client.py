@@ -0,0 +1,128 @@
+import json
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Flush triggers: whichever comes first
+MAX_BATCH_OPS = 8
+FLUSH_INTERVAL = 0.02  # seconds
+
+# Cheap probes that callers wait on with short timeouts. They go out in their
+# own /batch POST: /batch answers only after its slowest op, and the request
+# timeout is the batch's max, so sharing a POST with a layout/ingest would
+# make them as slow as that op
+LATENCY_SENSITIVE_OPS = frozenset({"health", "version"})
+
+# Batches in flight at once: the shared client serves every Streamlit session,
+# so one slow batch (e.g. a 30s ingest) mustn't hold up everyone else's
+MAX_INFLIGHT_BATCHES = 4
+
+# Keep-alive pool sizing (batch worker + concurrent /graph streams)
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 16
+
+
+def make_session() -> requests.Session:
+    """
+    Session with a sized keep-alive pool. Idempotent GETs (e.g. /graph) get an
+    immediate retry on a dropped connection; POSTs are never replayed.
+    """
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0, allowed_methods=frozenset({"GET", "HEAD"}))
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class BackendError(Exception):
+    """A /batch op came back with a non-200 status."""
+    def __init__(self, status: int, detail):
+        super().__init__(f"Backend Error ({status}): {detail}")
+        self.status = status
+        self.detail = detail
+
+
+class BatchClient:
+    """
+    Coalesces API calls into POST /batch requests over one keep-alive Session.
+
+    enqueue() returns a Future right away; a background thread collects ops for
+    up to FLUSH_INTERVAL (or MAX_BATCH_OPS) and sends them as a single request,
+    so e.g. a search and a graph fetch issued together cost one round trip.
+    Each batch is sent from a small executor, so batches don't queue behind
+    each other; ops within a batch still run in order. LATENCY_SENSITIVE_OPS
+    are split into a separate POST, so they don't wait on slow ops queued
+    with them (and aren't ordered after them).
+    """
+    def __init__(self, base_url: str, max_batch: int = MAX_BATCH_OPS, flush_interval: float = FLUSH_INTERVAL):
+        self.base_url = base_url
+        self.session = make_session()
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=MAX_INFLIGHT_BATCHES, thread_name_prefix="batch-send")
+        self._worker = threading.Thread(target=self._run, name="batch-client", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, op: str, payload: dict = None, timeout: float = 10) -> Future:
+        """
+        Schedules an operation ('search', 'ingest', 'graph', 'layout', 'version', 'health').
+        The Future resolves to {"status": int, "body": ...} or {"status": int, "detail": str}.
+        """
+        future = Future()
+        self._queue.put((op, payload or {}, timeout, future))
+        return future
+
+    def stream(self, path: str, payload: dict, timeout: float = 10):
+        """
+        POSTs straight to a streaming NDJSON endpoint (bypassing /batch) and yields
+        each decoded line as it arrives. Raises BackendError on a non-200 status.
+        """
+        # identity: a gzip'd stream would hold lines back in the compressor's buffer
+        headers = {"Accept-Encoding": "identity"}
+        with self.session.post(f"{self.base_url}{path}", json=payload, stream=True,
+                               timeout=timeout, headers=headers) as response:
+            if response.status_code != 200:
+                try:
+                    detail = response.json().get("detail")
+                except ValueError:
+                    detail = response.text
+                raise BackendError(response.status_code, detail)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def _run(self):
+        while True:
+            # Block for the first op, then gather more until size/time trigger
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            fast = [item for item in batch if item[0] in LATENCY_SENSITIVE_OPS]
+            slow = [item for item in batch if item[0] not in LATENCY_SENSITIVE_OPS]
+            for part in (fast, slow):
+                if part:
+                    self._senders.submit(self._flush, part)
+
+    def _flush(self, batch):
+        ops = [{"name": op, "body": payload} for op, payload, _, _ in batch]
+        timeout = max(t for _, _, t, _ in batch)
+        try:
+            response = self.session.post(f"{self.base_url}/batch", json={"ops": ops}, timeout=timeout)
+            response.raise_for_status()
+            results = response.json()["results"]
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        for (*_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -1,12 +1,93 @@
+import time
 import streamlit as st
 import requests
 import pandas as pd
 import visualizer # Imports the logic from visualizer.py
+from api_client import BatchClient, BackendError
 
 # --- CONFIG ---
 API_URL = "http://127.0.0.1:8000"
 st.set_page_config(page_title="HybridDB", layout="wide", page_icon="⚡")
 
+@st.cache_resource
+def get_client():
+    # One batching client (and keep-alive session) shared across reruns
+    return BatchClient(API_URL)
+
+client = get_client()
+# Extra wait on top of an op's own timeout (batch window + queueing); every
+# .result() is bounded so a stuck backend can't hang the script run
+RESULT_GRACE = 1  # seconds
+HEALTH_TIMEOUT = 1
+VERSION_TIMEOUT = 2
+LAYOUT_TIMEOUT = 30
+INGEST_TIMEOUT = 30
+
+# Health check is queued first and only awaited at the end of the run, so it
+# overlaps with the other calls instead of blocking (it rides its own /batch
+# POST with other probes, so slow ops can't make it time out)
+health_future = client.enqueue("health", timeout=HEALTH_TIMEOUT)
+# Last fetched graph, keyed by its ETag ({etag: graph_data}, at most one entry)
+graph_cache = st.session_state.setdefault("graph_cache", {})
+# Server-computed positions for that graph, same {etag: layout} shape
+layout_cache = st.session_state.setdefault("layout_cache", {})
+
+def graph_unchanged(version_future):
+    """True if the queued 'version' op says graph_cache still holds the current graph."""
+    try:
+        result = version_future.result(timeout=VERSION_TIMEOUT + RESULT_GRACE)
+    except Exception:
+        return False
+    return result["status"] == 200 and result["body"]["etag"] in graph_cache
+
+def fetch_layout(layout_future):
+    """Resolves a queued 'layout' op; None (client-side physics) if it failed."""
+    try:
+        result = layout_future.result(timeout=LAYOUT_TIMEOUT + RESULT_GRACE)
+    except Exception:
+        return None
+    if result["status"] != 200:
+        return None
+    body = result["body"]
+    if body["layout"] is not None:
+        layout_cache.clear()
+        layout_cache[body["etag"]] = body["layout"]
+    return layout_cache.get(body["etag"])
+
+# Recent searches: identical (query, mode, top_k) within the TTL skip the round trip
+SEARCH_CACHE_TTL = 60  # seconds
+SEARCH_CACHE_SIZE = 128
+
+@st.cache_resource
+def search_cache():
+    # {(query, mode, top_k): (fetched_at, results)}, shared across sessions.
+    # A plain dict rather than st.cache_data, because misses are streamed hit by hit.
+    return {}
+
+def cached_results(key):
+    entry = search_cache().get(key)
+    if entry is not None and time.monotonic() - entry[0] < SEARCH_CACHE_TTL:
+        return entry[1]
+    return None
+
+def store_results(key, results):
+    cache = search_cache()
+    cache.pop(key, None)
+    cache[key] = (time.monotonic(), results)
+    while len(cache) > SEARCH_CACHE_SIZE:
+        cache.pop(next(iter(cache)), None)  # oldest first
+
+def render_hit(slot, i, res):
+    """Fills one pre-allocated result slot."""
+    score = res.get('score', 0)
+    score_color = "green" if score > 0.5 else "orange"
+    with slot.container():
+        with st.expander(f"#{i+1} {res.get('id', 'Unknown')} (Score: :{score_color}[{score:.4f}])", expanded=True):
+            st.markdown(f"**Text:** {res.get('text', '')}")
+            st.markdown(f"**Reason:** `{res.get('reason', 'N/A')}`")
+            if res.get("metadata"):
+                st.json(res["metadata"])
+
 # --- CUSTOM CSS ---
 st.markdown("""
 <style>
@@ -24,20 +105,20 @@ st.markdown("""
         color: #FFFFFF !important; 
     }
     
-    /* Clean Tab Styling */
-    .stTabs [data-baseweb="tab-list"] {
+    /* Clean Tab Styling (section radio drawn as a tab bar) */
+    div[role="radiogroup"][aria-label="Section"] {
         gap: 24px;
     }
-    .stTabs [data-baseweb="tab"] {
+    div[role="radiogroup"][aria-label="Section"] label {
         height: 50px;
-        white-space: pre-wrap;
-        background-color: transparent;
-        border-radius: 4px 4px 0px 0px;
+        padding: 0 4px;
         color: #FFFFFF;
         font-weight: 600;
     }
-    .stTabs [aria-selected="true"] {
-        background-color: #0E1117;
+    div[role="radiogroup"][aria-label="Section"] label > div:first-child {
+        display: none;
+    }
+    div[role="radiogroup"][aria-label="Section"] label:has(input:checked) {
         border-bottom: 2px solid #FF4B8B;
         color: #FF4B8B;
     }
@@ -56,20 +137,20 @@ with st.sidebar:
     top_k = st.slider("Top K Results", 1, 20, 5)
     st.markdown("---")
     
-    # Simple Health Check Indicator
-    try:
-        requests.get(f"{API_URL}/", timeout=1)
-        st.success("Backend Connected")
-    except:
-        st.error("Backend Offline")
+    # Simple Health Check Indicator (filled in at the end of the run)
+    health_slot = st.empty()
 
 # --- TABS ---
-tab1, tab2, tab3 = st.tabs(["🔍 Search", "📥 Ingestion", "🕸️ Graph Explorer"])
+# A keyed radio instead of st.tabs: st.tabs runs (and mounts) every tab body on
+# each rerun, while this only runs the active section, so the graph component is
+# only built while the Graph Explorer is open
+SECTIONS = ["🔍 Search", "📥 Ingestion", "🕸️ Graph Explorer"]
+active_tab = st.radio("Section", SECTIONS, horizontal=True, key="active_tab", label_visibility="collapsed")
 
 # ==========================================
 # TAB 1: SEARCH
 # ==========================================
-with tab1:
+if active_tab == SECTIONS[0]:
     col1, col2 = st.columns([4, 1])
     with col1:
         query = st.text_input("Ask a question:", placeholder="e.g., Who created Python?")
@@ -81,32 +162,36 @@ with tab1:
     if search_btn and query:
         with st.spinner("Running Hybrid Retrieval..."):
             try:
-                payload = {"query": query, "mode": search_mode, "top_k": top_k}
-                response = requests.post(f"{API_URL}/search", json=payload, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    results = data.get("results", [])
-                    
-                    st.success(f"Found {len(results)} results in {search_mode} mode.")
-                    
-                    for i, res in enumerate(results):
-                        score = res.get('score', 0)
-                        score_color = "green" if score > 0.5 else "orange"
-                        with st.expander(f"#{i+1} {res.get('id', 'Unknown')} (Score: :{score_color}[{score:.4f}])", expanded=True):
-                            st.markdown(f"**Text:** {res.get('text', '')}")
-                            st.markdown(f"**Reason:** `{res.get('reason', 'N/A')}`")
-                            if res.get("metadata"):
-                                st.json(res["metadata"])
+                key = (query, search_mode, top_k)
+                status_slot = st.empty()
+                # One slot per possible hit, so hits keep rank order as they arrive
+                slots = [st.empty() for _ in range(top_k)]
+
+                results = cached_results(key)
+                if results is None:
+                    payload = {"query": query, "mode": search_mode, "top_k": top_k}
+                    results = []
+                    for line in client.stream("/search/stream", payload, timeout=10):
+                        if "count" in line:
+                            status_slot.info(f"Receiving {line['count']} results...")
+                            continue
+                        render_hit(slots[len(results)], len(results), line)
+                        results.append(line)
+                    store_results(key, results)
                 else:
-                    st.error(f"Backend Error: {response.text}")
+                    for i, res in enumerate(results):
+                        render_hit(slots[i], i, res)
+
+                status_slot.success(f"Found {len(results)} results in {search_mode} mode.")
+            except BackendError as e:
+                st.error(str(e))
             except Exception as e:
                 st.error(f"Connection failed: {str(e)}")
 
 # ==========================================
 # TAB 2: INGESTION
 # ==========================================
-with tab2:
+if active_tab == SECTIONS[1]:
     st.subheader("Teach the Database")
     text_input = st.text_area("Paste Raw Text / Article:", height=150, 
                               placeholder="Paste a Wikipedia article or document content here...")
@@ -119,24 +204,27 @@ with tab2:
         with st.spinner("Processing NLP Pipeline..."):
             try:
                 payload = {"text": text_input, "metadata": {"source": "user_input"}}
-                response = requests.post(f"{API_URL}/ingest", json=payload, timeout=30)
+                ingest_future = client.enqueue("ingest", payload, timeout=INGEST_TIMEOUT)
+                result = ingest_future.result(timeout=INGEST_TIMEOUT + RESULT_GRACE)
                 
-                if response.status_code == 200:
-                    data = response.json()
+                if result["status"] == 200:
+                    data = result["body"]
+                    # New data changes search results too
+                    search_cache().clear()
                     st.balloons()
                     st.success("Ingestion Complete!")
                     m1, m2 = st.columns(2)
                     m1.metric("Nodes Created", data.get('nodes_count', 0))
                     m2.metric("Edges Created", data.get('edges_count', 0))
                 else:
-                    st.error(f"Ingestion Failed: {response.text}")
+                    st.error(f"Ingestion Failed: {result.get('detail')}")
             except Exception as e:
                 st.error(f"Connection Error: {e}")
 
 # ==========================================
 # TAB 3: VISUALIZATION (Centered & Spacious)
 # ==========================================
-with tab3:
+if active_tab == SECTIONS[2]:
     col_head, col_act = st.columns([6, 1])
     with col_head:
         st.subheader("Knowledge Graph Topology")
@@ -155,14 +243,36 @@ with tab3:
         
         try:
             with st.spinner("Fetching Graph Topology..."):
-                response = requests.get(f"{API_URL}/graph", timeout=5)
-                
-                if response.status_code == 200:
-                    graph_data = response.json()
-                    # Pass the data to the dedicated visualizer module
-                    visualizer.render_graph(graph_data)
+                # Version check and layout share one /batch round trip; the layout
+                # is computed server-side and fetched alongside the topology
+                version_future = None
+                if graph_cache:
+                    version_future = client.enqueue("version", {"collapse": visualizer.COLLAPSE_MIN_SIZE}, timeout=VERSION_TIMEOUT)
+                layout_payload = {"etag": next(iter(layout_cache), None), "collapse": visualizer.COLLAPSE_MIN_SIZE}
+                layout_future = client.enqueue("layout", layout_payload, timeout=LAYOUT_TIMEOUT)
+                if version_future is not None and graph_unchanged(version_future):
+                    # Unchanged since last fetch: redraw the cached graph, no /graph request
+                    visualizer.render_graph(next(iter(graph_cache.values())), layout=fetch_layout(layout_future))
                 else:
-                    st.error(f"Failed to fetch graph data (Status: {response.status_code})")
-                    
+                    # Stream the topology: nodes/edges are built as the payload arrives
+                    # (replayed from graph_cache when the server answers 304)
+                    stream = visualizer.iter_graph(
+                        f"{API_URL}/graph", timeout=5, session=client.session, cache=graph_cache,
+                        params={"collapse": visualizer.COLLAPSE_MIN_SIZE}
+                    )
+                    visualizer.render_graph(stream, layout=fetch_layout(layout_future))
+
+        except requests.HTTPError as e:
+            st.error(f"Failed to fetch graph data (Status: {e.response.status_code})")
         except Exception as e:
-            st.warning(f"Could not connect to visualization backend: {e}")
\ No newline at end of file
+            st.warning(f"Could not connect to visualization backend: {e}")
+
+# --- HEALTH INDICATOR ---
+try:
+    backend_up = health_future.result(timeout=HEALTH_TIMEOUT + RESULT_GRACE)["status"] == 200
+except:
+    backend_up = False
+if backend_up:
+    health_slot.success("Backend Connected")
+else:
+    health_slot.error("Backend Offline")
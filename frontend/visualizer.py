@@ -1,109 +1,342 @@
-import random
+import json
+import os
+from html import escape as html_escape
+import ijson
+import numpy as np
+import requests
 import streamlit as st
-from streamlit_agraph import agraph, Node, Edge, Config
+import streamlit.components.v1 as components
+
+# Optional: MessagePack /graph bodies decode several times faster than JSON
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
 
 # --- THEME COLORS ---
 BG_COLOR = "#0E1117"
 EDGE_COLOR = "#606060" 
 TEXT_COLOR = "#FFFFFF"
 
+# Curved edges add hidden support bodies to the physics simulation, so large
+# graphs get straight edges instead
+CURVED_EDGE_LIMIT = 500
+# Above this many nodes, exact O(N^2) ForceAtlas2 repulsion is replaced by Barnes-Hut
+BARNES_HUT_NODE_LIMIT = 500
+
+# Above this many nodes vis-network's DOM path stalls; hand off to Sigma.js (WebGL)
+WEBGL_NODE_LIMIT = 1500
+SIGMA_TEMPLATE = os.path.join(os.path.dirname(__file__), "sigma_host.html")
+# vis-network host page for the regular renderer (fed plain dicts, no agraph wrappers)
+VIS_TEMPLATE = os.path.join(os.path.dirname(__file__), "vis_host.html")
+HIGHLIGHT_COLOR = "#F7A557"
+
+# Canvas height: a base strip plus a row per node, capped at roughly one viewport
+MAX_GRAPH_HEIGHT = 1200
+BASE_GRAPH_HEIGHT = 40
+HEIGHT_PER_NODE = 25
+
+# Ask the backend to fold dense communities of at least this many nodes into
+# matrix nodes (it only does so for large graphs)
+COLLAPSE_MIN_SIZE = 8
+
+# Server layouts come back in [-1, 1]; spread them over a canvas that grows with N
+LAYOUT_SCALE = 500
+
+# One PCG64 generator for the module: no global-state lock, bulk draws in C
+_RNG = np.random.default_rng()
+
 # A palette of soft cyberpunk colors for nodes
 PALETTE = [
     "#00E5FF", "#FF4B8B", "#7C4DFF", "#00FFB3", "#FFD93D",
     "#FF6F61", "#40C4FF", "#B388FF", "#69F0AE"
 ]
 
-def pick_color():
-    """Returns a random color from the palette."""
-    return random.choice(PALETTE)
+def make_edge(e):
+    """Builds the styled vis-network edge dict for one API link."""
+    return {
+        "from": e["source"],
+        "to": e["target"],
+        "label": e.get("type", ""),
+        "color": EDGE_COLOR,
+        "width": 2,
+        "arrows": "to",
+        "font": {"color": "#CCCCCC", "size": 10, "align": "middle"}
+        # smooth is set once for all edges in render_graph's options
+    }
+
+def physics_options(n_nodes):
+    """
+    vis-network physics for a graph of n_nodes.
+    Small graphs keep ForceAtlas2 (Barnes-Hut jitters at small N); large ones use
+    the barnesHut solver, whose quadtree makes repulsion O(N log N). theta trades
+    accuracy for speed: lower is closer to exact, higher approximates more.
+    """
+    stabilization = {
+        "enabled": True,
+        "iterations": 75,
+        "updateInterval": 25,
+        "fit": True
+    }
+    if n_nodes > BARNES_HUT_NODE_LIMIT:
+        return {
+            "enabled": True,
+            "solver": "barnesHut",
+            "barnesHut": {
+                "theta": 0.5,
+                "gravitationalConstant": -8000,
+                "springLength": 200,
+                "avoidOverlap": 0.5
+            },
+            "minVelocity": 0.75,
+            "stabilization": {**stabilization, "iterations": 100}
+        }
+    return {
+        "enabled": True,
+        "solver": "forceAtlas2Based",
+        "forceAtlas2Based": {
+            "gravitationalConstant": -100, # Repulsion
+            "centralGravity": 0.005,       # Gentle pull to center
+            "springLength": 200,           # Long edges
+            "springConstant": 0.05,        # Bouncy
+            "avoidOverlap": 1              # Prevent nodes covering each other
+        },
+        # Settle sooner: the simulation loop stops once every node is
+        # slower than this, so the canvas goes idle after layout
+        "minVelocity": 0.75,
+        "stabilization": stabilization
+    }
+
+def iter_graph(url, timeout=5, session=None, cache=None, params=None):
+    """
+    Streams the /graph payload, yielding ("node", dict) and ("link", dict)
+    pairs as they are parsed off the socket (single SAX pass with ijson).
+
+    cache: optional {etag: graph_data} dict (e.g. in st.session_state). Its ETag
+    is sent as If-None-Match; a 304 replays the cached graph, otherwise the
+    streamed graph replaces the cache entry.
 
-def render_graph(graph_data):
+    With msgpack installed, MessagePack is preferred over JSON; a msgpack body
+    is decoded in one unpackb call rather than streamed.
+    """
+    http = session or requests
+    etag, cached = next(iter(cache.items()), (None, None)) if cache else (None, None)
+    headers = {"If-None-Match": etag} if etag else {}
+    if MSGPACK_AVAILABLE:
+        headers["Accept"] = f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.5"
+
+    with http.get(url, params=params, stream=True, timeout=timeout, headers=headers) as response:
+        if response.status_code == 304 and cached is not None:
+            yield from _graph_items(cached)
+            return
+        response.raise_for_status()
+        new_etag = response.headers.get("ETag")
+
+        if response.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+            graph_data = msgpack.unpackb(response.content, raw=False)
+            if cache is not None and new_etag:
+                cache.clear()
+                cache[new_etag] = graph_data
+            yield from _graph_items(graph_data)
+            return
+
+        response.raw.decode_content = True
+        collected = {"nodes": [], "links": []}
+        item_prefixes = {"nodes.item": "node", "links.item": "link"}
+        builder = None
+        current = None
+        for prefix, event, value in ijson.parse(response.raw, use_float=True):
+            if builder is None:
+                if event == "start_map" and prefix in item_prefixes:
+                    current = prefix
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                continue
+
+            builder.event(event, value)
+            if event == "end_map" and prefix == current:
+                kind = item_prefixes[current]
+                collected[kind + "s"].append(builder.value)
+                yield kind, builder.value
+                builder = None
+
+        if cache is not None and new_etag:
+            cache.clear()
+            cache[new_etag] = collected
+
+def _graph_items(graph_data):
+    """Accepts a node-link dict or an iter_graph() stream; yields (kind, item)."""
+    if isinstance(graph_data, dict):
+        for n in graph_data.get("nodes", []):
+            yield "node", n
+        for e in graph_data.get("links", []):
+            yield "link", e
+    else:
+        yield from graph_data
+
+def render_graph(graph_data, layout=None):
     """
     Renders a dynamic graph based on API data.
     Designed to fill the container width provided by the parent app.
+    Accepts the full node-link dict, or the iter_graph() stream so nodes and
+    edges are built while the payload is still downloading.
+
+    layout: optional {id: [x, y]} from /graph/layout. When it covers every node,
+    nodes are pinned there and the browser runs no physics at all.
+    Graphs above WEBGL_NODE_LIMIT nodes go to render_graph_webgl (Sigma.js) instead.
+    Collapsed community nodes ({"kind": "matrix"}) are drawn as one square node,
+    with their adjacency matrices listed below the graph.
     """
-    if not graph_data or not graph_data.get("nodes"):
+    if not graph_data:
         st.info("No graph data to display yet. Try ingesting some text first!")
         return
 
-    # --- PARSE NODES ---
-    nodes = []
-    existing_ids = set()
+    # Unique node ids -> labels in arrival order; node/edge dicts are built once
+    # N is known (and only for the renderer that ends up drawing them)
+    node_ids = {}
+    clusters = {}
+    links = []
     
     # We iterate through the data from the API
-    for n in graph_data.get("nodes", []):
-        node_id = n.get("id", "Unknown")
-        
-        if node_id in existing_ids:
+    for kind, item in _graph_items(graph_data):
+        if kind == "link":
+            links.append(item)
             continue
-        existing_ids.add(node_id)
-
-        # Assign random color and random initial position to prevent stacking
-        color = pick_color()
-        initial_x = random.randint(-500, 500)
-        initial_y = random.randint(-500, 500)
-
-        # Create Node Object
-        nodes.append(
-            Node(
-                id=node_id,
-                label=node_id,
-                size=30,               # Large visibility
-                color=color,
-                shape="dot",
-                x=initial_x,           # Random start pos helps physics engine
-                y=initial_y,
-                borderWidth=2,
-                font={"color": TEXT_COLOR, "size": 14},
-                title=f"Entity: {node_id}" # Tooltip
-            )
-        )
-
-    # --- PARSE EDGES ---
-    edges = []
-    for e in graph_data.get("links", []):
-        edges.append(
-            Edge(
-                source=e["source"],
-                target=e["target"],
-                label=e.get("type", ""),
-                color=EDGE_COLOR,
-                width=2,
-                arrows="to",
-                font={"color": "#CCCCCC", "size": 10, "align": "middle"},
-                smooth={"type": "curvedCW", "roundness": 0.2} # Curved lines look cleaner
-            )
-        )
+        node_id = item.get("id", "Unknown")
+        if item.get("kind") == "matrix":
+            clusters[node_id] = item
+            node_ids[node_id] = f"Cluster ({len(item['nodes'])} entities)"
+        else:
+            node_ids[node_id] = node_id
 
-    # --- CONFIGURATION ---
-    # width="100%" ensures it fills the Streamlit column (80% area defined in app.py)
-    config = Config(
-        width="100%",
-        height="2000px",
-        directed=True,
-        backgroundColor=BG_COLOR,
-        nodeHighlightBehavior=True,
-        highlightColor="#F7A557",
-        collapsible=False,
-        
-        # Physics Engine: Tuned for spreading nodes out
-        physics={
-            "enabled": True,
-            "solver": "forceAtlas2Based",
-            "forceAtlas2Based": {
-                "gravitationalConstant": -100, # Repulsion
-                "centralGravity": 0.005,       # Gentle pull to center
-                "springLength": 200,           # Long edges
-                "springConstant": 0.05,        # Bouncy
-                "avoidOverlap": 1              # Prevent nodes covering each other
-            },
-            "stabilization": {
-                "enabled": True,
-                "iterations": 200,
-                "fit": True
-            }
+    if not node_ids:
+        st.info("No graph data to display yet. Try ingesting some text first!")
+        return
+
+    # --- PARSE NODES ---
+    # Random color and random initial position (prevents stacking), drawn for
+    # all N nodes in one vectorized call each
+    n = len(node_ids)
+    fixed = bool(layout) and all(node_id in layout for node_id in node_ids)
+    if fixed:
+        scale = LAYOUT_SCALE * max(1.0, (n / 100) ** 0.5)
+        coords = (np.array([layout[node_id] for node_id in node_ids]) * scale).round().astype(int).tolist()
+    else:
+        coords = _RNG.integers(-500, 501, size=(n, 2)).tolist()
+    colors = np.array(PALETTE)[_RNG.integers(len(PALETTE), size=n)].tolist()
+
+    if n > WEBGL_NODE_LIMIT:
+        result = render_graph_webgl(node_ids, links, coords, colors, positioned=fixed)
+        render_cluster_matrices(clusters)
+        return result
+
+    # Plain vis-network dicts, serialized once straight into the host page
+    nodes = [
+        {
+            "id": node_id,
+            "label": label,
+            "size": 45 if node_id in clusters else 30,  # Large visibility
+            "color": {"background": color, "border": color, "highlight": HIGHLIGHT_COLOR},
+            "shape": "square" if node_id in clusters else "dot",
+            "x": x,                # Server layout, or random start pos for the physics engine
+            "y": y,
+            "physics": not fixed,
+            "borderWidth": 2,
+            "font": {"color": TEXT_COLOR, "size": 14},
+            "title": f"Entity: {node_id}" if node_id not in clusters else label # Tooltip
         }
-    )
+        for (node_id, label), (x, y), color in zip(node_ids.items(), coords, colors)
+    ]
+
+    edges = [make_edge(e) for e in links]
+
+    # Curved lines look cleaner, but only while the graph is small
+    edge_smooth = {"type": "curvedCW", "roundness": 0.2} if len(edges) <= CURVED_EDGE_LIMIT else False
+
+    # --- CONFIGURATION ---
+    # The host page fills the iframe, and components.html fills the Streamlit
+    # column (80% area defined in app.py). Small graphs get a small canvas;
+    # stabilization's fit still frames everything.
+    height = min(MAX_GRAPH_HEIGHT, BASE_GRAPH_HEIGHT + HEIGHT_PER_NODE * len(nodes))
+    options = {
+        "height": f"{height}px",
+        "width": "100%",
+        "interaction": {"hover": True},
+        # Physics Engine: Tuned for spreading nodes out (off when pre-laid-out)
+        "physics": {"enabled": False} if fixed else physics_options(len(nodes)),
+        "edges": {"smooth": edge_smooth}
+    }
 
     # Render the graph
-    return agraph(nodes=nodes, edges=edges, config=config)
\ No newline at end of file
+    result = components.html(_fill_template(VIS_TEMPLATE, {"nodes": nodes, "edges": edges, "options": options}), height=height)
+    render_cluster_matrices(clusters)
+    return result
+
+def render_graph_webgl(node_ids, links, coords, colors, positioned=False, height=MAX_GRAPH_HEIGHT):
+    """
+    Large-graph path: draws with Sigma.js on a WebGL canvas inside a components.html
+    iframe, so frame cost no longer scales with one DOM/SVG element per node.
+    Without server positions, the page runs a fixed ForceAtlas2 pass before drawing.
+    """
+    payload = {
+        "nodes": [
+            {"key": node_id, "attributes": {"label": label, "x": x, "y": y, "size": 4, "color": color}}
+            for (node_id, label), (x, y), color in zip(node_ids.items(), coords, colors)
+        ],
+        "edges": [
+            {"source": e["source"], "target": e["target"],
+             "attributes": {"label": e.get("type", ""), "color": EDGE_COLOR}}
+            for e in links
+            if e["source"] in node_ids and e["target"] in node_ids
+        ],
+        "positioned": positioned,
+    }
+    return components.html(_fill_template(SIGMA_TEMPLATE, payload), height=height)
+
+def _fill_template(path, payload):
+    """Reads a host page and substitutes the theme colors and the JSON payload."""
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    # "</" is escaped so entity labels can't close the <script> block early
+    data = json.dumps(payload).replace("</", "<\\/")
+    return (html.replace("{{background}}", BG_COLOR)
+                .replace("{{text_color}}", TEXT_COLOR)
+                .replace("{{data}}", data))
+
+def render_cluster_matrices(clusters):
+    """
+    NodeTrix-style detail for collapsed communities: one adjacency matrix per
+    cluster (a filled cell is an edge row -> column), inside a closed expander
+    so its internal edges cost nothing in the node-link view.
+    """
+    for cluster_id, cluster in clusters.items():
+        members = cluster["nodes"]
+        with st.expander(f"{cluster_id}: {len(members)} entities, {len(cluster['adjacency'])} internal edges"):
+            components.html(_matrix_html(members, cluster["adjacency"]), height=min(800, 22 * len(members) + 140), scrolling=True)
+
+def _matrix_html(members, adjacency):
+    """Small HTML table for one cluster's adjacency matrix."""
+    filled = {(i, j) for i, j in adjacency}
+    names = [html_escape(m) for m in members]
+    header = "".join(f'<th class="col"><div>{name}</div></th>' for name in names)
+    rows = "".join(
+        f"<tr><th>{name}</th>"
+        + "".join('<td class="on"></td>' if (i, j) in filled else "<td></td>" for j in range(len(members)))
+        + "</tr>"
+        for i, name in enumerate(names)
+    )
+    return f"""
+    <style>
+        body {{ background: {BG_COLOR}; color: {TEXT_COLOR}; font: 11px sans-serif; margin: 0; }}
+        table {{ border-collapse: collapse; }}
+        th {{ font-weight: normal; text-align: right; padding-right: 4px; white-space: nowrap; }}
+        th.col {{ height: 120px; vertical-align: bottom; }}
+        th.col div {{ writing-mode: vertical-rl; transform: rotate(180deg); }}
+        td {{ width: 14px; height: 14px; border: 1px solid #222; }}
+        td.on {{ background: {PALETTE[1]}; }}
+    </style>
+    <table><tr><th></th>{header}</tr>{rows}</table>
+    """